@@ -1,14 +1,21 @@
 import asyncio
+import copy
+import json
 import logging
+import logging.handlers
 import os
-from typing import Union
+import queue
+import sys
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Any, Mapping, Optional, TextIO, Union
 
 import a2s
 import discord
 from discord.ext import tasks
 
-logging.basicConfig(level=logging.INFO)
-
 
 # Helper function to clean environment variables
 def clean_env_var(value: Union[str, None], default: str = "") -> str:
@@ -19,37 +26,447 @@ def clean_env_var(value: Union[str, None], default: str = "") -> str:
     return value.split("#")[0].strip() or default
 
 
-TOKEN = clean_env_var(os.getenv("DISCORD_TOKEN"))
-CHANNEL_ID = int(clean_env_var(os.getenv("DISCORD_CHANNEL_ID"), "0"))
-MESSAGE_ID = int(clean_env_var(os.getenv("DISCORD_MESSAGE_ID"), "0"))
-HOST = clean_env_var(os.getenv("VALHEIM_HOST"), "localhost")
-PORT = int(clean_env_var(os.getenv("VALHEIM_QUERY_PORT"), "2457"))
-UPDATE_PERIOD = int(clean_env_var(os.getenv("UPDATE_PERIOD"), "60"))
+@dataclass(frozen=True)
+class Config:
+    """Bot settings, normally read from the environment via ``from_env``."""
+
+    token: str = ""
+    channel_id: int = 0
+    message_id: int = 0
+    host: str = "localhost"
+    port: int = 2457
+    update_period: int = 60
+    offline_threshold: int = 3
+
+    @property
+    def address(self) -> tuple[str, int]:
+        return (self.host, self.port)
+
+    @classmethod
+    def from_env(cls, env: Optional[Mapping[str, str]] = None) -> "Config":
+        env = os.environ if env is None else env
+        return cls(
+            token=clean_env_var(env.get("DISCORD_TOKEN")),
+            channel_id=int(clean_env_var(env.get("DISCORD_CHANNEL_ID"), "0")),
+            message_id=int(clean_env_var(env.get("DISCORD_MESSAGE_ID"), "0")),
+            host=clean_env_var(env.get("VALHEIM_HOST"), "localhost"),
+            port=int(clean_env_var(env.get("VALHEIM_QUERY_PORT"), "2457")),
+            update_period=int(clean_env_var(env.get("UPDATE_PERIOD"), "60")),
+            offline_threshold=int(clean_env_var(env.get("OFFLINE_THRESHOLD"), "3")),
+        )
+
+
+LOG_REPEAT_INTERVAL = 300.0  # seconds between samples of a repeated log line
+QUERY_TIMEOUT = 3.0  # hard ceiling for a single A2S request (seconds)
+PROBE_ATTEMPTS = 2  # primary request + one hedge
+
+
+# -------- Logging --------
+class JsonFormatter(logging.Formatter):
+    """Render each log record as a single JSON object."""
+
+    EXTRA_FIELDS = ("server", "repeats")
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in self.EXTRA_FIELDS:
+            if hasattr(record, field):
+                entry[field] = getattr(record, field)
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = record.exc_text
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class RepeatFilter(logging.Filter):
+    """Collapse identical records per server into one sample per interval.
+
+    The first occurrence of a message passes straight through. Repeats within
+    ``interval`` seconds are dropped and counted; the next record let through
+    for that message carries the count in its ``repeats`` attribute.
+
+    Counts still pending are never lost: the last dropped record is released
+    with the remaining count when another message for the same server passes
+    (e.g. "Reachable again" after an outage), when ``sweep()`` finds the
+    message idle for a whole interval, on ``flush()``, or when it is evicted
+    as the least recently seen of ``MAX_KEYS`` tracked messages. Released
+    records are collected with ``drain()``.
+    """
+
+    MAX_KEYS = 1024
+
+    def __init__(self, interval: float = LOG_REPEAT_INTERVAL) -> None:
+        super().__init__()
+        self.interval = interval
+        # key -> [sampled at, last seen at, dropped count, last dropped record]
+        self._seen: dict[tuple[Any, ...], list[Any]] = {}
+        self._released: list[logging.LogRecord] = []
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        try:
+            message = record.getMessage()
+        except Exception:
+            # Malformed call: let the handler report it through handleError.
+            return True
+        server = getattr(record, "server", None)
+        key = (record.name, record.levelno, server, message)
+        now = time.monotonic()
+        with self._lock:
+            seen = self._seen.pop(key, None)
+            if seen is not None and now - seen[0] < self.interval:
+                seen[1] = now
+                seen[2] += 1
+                seen[3] = record
+                # Re-inserting keeps the dict ordered from least to most recent.
+                self._seen[key] = seen
+                return False
+            if seen is not None and seen[2]:
+                record.repeats = seen[2]
+            if server is not None:
+                for other_key, other in self._seen.items():
+                    if other_key[2] == server:
+                        self._release(other)
+            while len(self._seen) >= self.MAX_KEYS:
+                self._release(self._seen.pop(next(iter(self._seen))))
+            self._seen[key] = [now, now, 0, None]
+        return True
+
+    def sweep(self) -> None:
+        """Forget messages not seen for a whole interval, releasing repeats."""
+        now = time.monotonic()
+        with self._lock:
+            for key, seen in list(self._seen.items()):
+                if now - seen[1] >= self.interval:
+                    self._release(self._seen.pop(key))
+
+    def flush(self) -> None:
+        """Release every pending repeat count, e.g. on shutdown."""
+        with self._lock:
+            for seen in self._seen.values():
+                self._release(seen)
+
+    def drain(self) -> list[logging.LogRecord]:
+        """Return (and forget) the records released so far."""
+        with self._lock:
+            released, self._released = self._released, []
+        return released
+
+    def _release(self, seen: list[Any]) -> None:
+        dropped, record = seen[2], seen[3]
+        if record is not None:
+            # The last dropped record stands in for the others.
+            if dropped > 1:
+                record.repeats = dropped - 1
+            self._released.append(record)
+        seen[2], seen[3] = 0, None
+
+
+_EXC_FORMATTER = logging.Formatter()
+
+
+class JsonQueueHandler(logging.handlers.QueueHandler):
+    """Queue handler that keeps records structured for ``JsonFormatter``.
+
+    The stock ``prepare()`` folds the traceback into ``msg``; here the
+    message is merged with its args but the traceback is kept in
+    ``exc_text``. Repeat counts released by ``repeat_filter`` are queued
+    ahead of the record that released them.
+    """
+
+    def __init__(
+        self,
+        log_queue: "queue.SimpleQueue[logging.LogRecord]",
+        repeat_interval: float = LOG_REPEAT_INTERVAL,
+    ) -> None:
+        super().__init__(log_queue)
+        self.repeat_filter = RepeatFilter(repeat_interval)
+        self.addFilter(self.repeat_filter)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self._enqueue_released()
+        super().emit(record)
+
+    def sweep(self) -> None:
+        """Queue repeat counts of messages that have gone quiet."""
+        self.repeat_filter.sweep()
+        self._enqueue_released()
+
+    def flush(self) -> None:
+        """Queue every pending repeat count."""
+        self.repeat_filter.flush()
+        self._enqueue_released()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _EXC_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def _enqueue_released(self) -> None:
+        for released in self.repeat_filter.drain():
+            self.enqueue(self.prepare(released))
+
+
+class JsonQueueListener(logging.handlers.QueueListener):
+    """Queue listener that also sweeps idle repeats on a timer.
+
+    ``stop()`` detaches the handler from the root logger and flushes pending
+    repeat counts before the queue is drained, so none are lost on shutdown.
+    """
+
+    def __init__(
+        self, queue_handler: JsonQueueHandler, *handlers: logging.Handler
+    ) -> None:
+        super().__init__(queue_handler.queue, *handlers)
+        self.queue_handler = queue_handler
+        self._stop_sweeping = threading.Event()
+        self._sweeper: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        super().start()
+        self._stop_sweeping.clear()
+        self._sweeper = threading.Thread(target=self._sweep, daemon=True)
+        self._sweeper.start()
 
-ADDRESS = (HOST, PORT)
+    def stop(self) -> None:
+        if self._sweeper is None:
+            return
+        self._stop_sweeping.set()
+        self._sweeper.join()
+        self._sweeper = None
+        logging.getLogger().removeHandler(self.queue_handler)
+        self.queue_handler.flush()
+        super().stop()
+
+    def _sweep(self) -> None:
+        interval = self.queue_handler.repeat_filter.interval
+        while not self._stop_sweeping.wait(interval):
+            self.queue_handler.sweep()
+
+
+def setup_logging(
+    level: int = logging.INFO,
+    stream: Optional[TextIO] = None,
+    repeat_interval: float = LOG_REPEAT_INTERVAL,
+) -> JsonQueueListener:
+    """Send log records through a queue to a background JSON writer.
+
+    The caller owns the returned listener and must ``stop()`` it on shutdown
+    so pending repeat counts and queued records are flushed.
+    """
+    log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+    queue_handler = JsonQueueHandler(log_queue, repeat_interval)
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter())
+    listener = JsonQueueListener(queue_handler, output)
+
+    root = logging.getLogger()
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+    listener.start()
+    return listener
+
+
+# -------- Reachability --------
+class ServerProbe:
+    """Track whether a server is reachable using hedged A2S info queries.
+
+    A hedge is sent once the first request has been outstanding longer than
+    the adaptive timeout (smoothed RTT + 4 * RTT variance, as in RFC 6298),
+    or immediately if it fails outright. All requests of one probe share a
+    single ``max_timeout`` deadline. As in RFC 6298, the timeout doubles
+    after every failed probe (up to ``max_timeout``) and resets on success.
+    The server is only declared offline after ``failure_threshold``
+    consecutive failed probes. While offline a single request is sent per
+    probe, capped at ``RECOVERY_TIMEOUT`` so down ticks stay cheap; every
+    ``FULL_PROBE_EVERY``-th offline probe waits the full ``max_timeout`` so a
+    server that came back with a higher RTT is still noticed.
+    """
+
+    MIN_TIMEOUT = 0.25
+    INITIAL_TIMEOUT = 1.0
+    RECOVERY_TIMEOUT = 1.0
+    FULL_PROBE_EVERY = 5
+
+    def __init__(
+        self,
+        address: tuple[str, int],
+        *,
+        max_timeout: float = QUERY_TIMEOUT,
+        attempts: int = PROBE_ATTEMPTS,
+        failure_threshold: int = 3,
+    ) -> None:
+        self.address = address
+        self.max_timeout = max_timeout
+        self.attempts = max(1, attempts)
+        self.failure_threshold = max(1, failure_threshold)
+        self.consecutive_failures = 0
+        self.offline = False
+        self.srtt: Optional[float] = None
+        self.rttvar = 0.0
+        self.backoff = 1
+        self.last_error: Optional[BaseException] = None
+        self.log_extra = {"server": f"{address[0]}:{address[1]}"}
+
+    @property
+    def timeout(self) -> float:
+        """Adaptive timeout derived from observed round-trip times."""
+        if self.srtt is None:
+            estimate = self.INITIAL_TIMEOUT
+        else:
+            estimate = self.srtt + 4 * self.rttvar
+        estimate = max(self.MIN_TIMEOUT, estimate) * self.backoff
+        return min(self.max_timeout, estimate)
+
+    @property
+    def recovery_timeout(self) -> float:
+        """Timeout for the single request sent per probe while offline."""
+        offline_probes = self.consecutive_failures - self.failure_threshold
+        if offline_probes % self.FULL_PROBE_EVERY == self.FULL_PROBE_EVERY - 1:
+            return self.max_timeout
+        return min(self.timeout, self.RECOVERY_TIMEOUT)
+
+    def observe_rtt(self, rtt: float) -> None:
+        """Fold a successful round-trip time into the RTT estimate."""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = 0.75 * self.rttvar + 0.25 * abs(self.srtt - rtt)
+            self.srtt = 0.875 * self.srtt + 0.125 * rtt
+
+    async def probe(self) -> Optional[Any]:
+        """Query the server once and return its info, or ``None`` on failure."""
+        if self.offline:
+            info = await self._attempt_or_none(self.recovery_timeout)
+        else:
+            info = await self._hedged()
+
+        if info is None:
+            self.consecutive_failures += 1
+            if self.timeout < self.max_timeout:
+                self.backoff *= 2
+            logging.warning(
+                f"A2S_INFO probe failed: {self.last_error!r}", extra=self.log_extra
+            )
+            if not self.offline and self.consecutive_failures >= self.failure_threshold:
+                self.offline = True
+                logging.warning(
+                    f"Unreachable after {self.consecutive_failures} consecutive probes",
+                    extra=self.log_extra,
+                )
+            return None
+
+        if self.offline:
+            logging.info("Reachable again", extra=self.log_extra)
+        self.consecutive_failures = 0
+        self.backoff = 1
+        self.offline = False
+        return info
+
+    async def _attempt(self, timeout: float) -> Any:
+        start = time.monotonic()
+        info = await asyncio.to_thread(a2s.info, self.address, timeout=timeout)
+        self.observe_rtt(time.monotonic() - start)
+        return info
+
+    async def _attempt_or_none(self, timeout: float) -> Optional[Any]:
+        try:
+            return await self._attempt(timeout)
+        except Exception as exc:
+            self.last_error = exc
+            return None
+
+    async def _hedged(self) -> Optional[Any]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.max_timeout
+        pending: set[asyncio.Task[Any]] = set()
+        launched = 0
+        try:
+            while True:
+                # Hedges only get what is left of the probe's deadline.
+                remaining = self.max_timeout if not launched else deadline - loop.time()
+                if remaining <= 0:
+                    self.last_error = TimeoutError(
+                        f"no reply within {self.max_timeout}s"
+                    )
+                    return None
+                if launched < self.attempts:
+                    pending.add(asyncio.create_task(self._attempt(remaining)))
+                    launched += 1
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=(
+                        min(self.timeout, remaining)
+                        if launched < self.attempts
+                        else remaining
+                    ),
+                    return_when=asyncio.FIRST_COMPLETED,
+                )
+                for task in done:
+                    error = task.exception()
+                    if error is None:
+                        return task.result()
+                    self.last_error = error
+                if not pending and launched >= self.attempts:
+                    return None
+        finally:
+            for task in pending:
+                task.cancel()
 
 
 # -------- Discord client --------
 class ValheimBot(discord.Client):
+    def __init__(self, config: Config, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.config = config
+        self.probe = ServerProbe(
+            config.address, failure_threshold=config.offline_threshold
+        )
+        self.update_status.change_interval(seconds=config.update_period)
+
     async def on_ready(self) -> None:
-        channel = await self.fetch_channel(CHANNEL_ID)
+        channel = await self.fetch_channel(self.config.channel_id)
         if not isinstance(channel, (discord.TextChannel, discord.Thread)):
-            logging.error(f"Channel {CHANNEL_ID} is not a text channel or thread.")
+            logging.error(
+                f"Channel {self.config.channel_id} is not a text channel or thread."
+            )
             # You might want to handle this more gracefully
             self.message = None
         else:
-            self.message = await channel.fetch_message(MESSAGE_ID)
+            self.message = await channel.fetch_message(self.config.message_id)
 
         self.channel = channel
-        logging.info(f"Connected as {self.user} – monitoring {ADDRESS}")
+        logging.info(f"Connected as {self.user} – monitoring {self.config.address}")
         self.update_status.start()
 
-    @tasks.loop(seconds=UPDATE_PERIOD)
+    @tasks.loop(seconds=60)  # interval is set per instance from config
     async def update_status(self) -> None:
-        try:
-            info = await asyncio.to_thread(a2s.info, ADDRESS, timeout=3)
+        info = await self.probe.probe()
+        if info is None:
+            if not self.probe.offline:
+                # Below the failure threshold: keep showing the last known state.
+                return
+            status_line = "🔴 **Offline / unreachable**"
+            title = "⚠️ Valheim Server"
+        else:
             try:
-                rules = await asyncio.to_thread(a2s.rules, ADDRESS, timeout=3)
+                rules = await asyncio.to_thread(
+                    a2s.rules, self.config.address, timeout=QUERY_TIMEOUT
+                )
             except Exception:
                 rules = {}
 
@@ -79,12 +496,13 @@ class ValheimBot(discord.Client):
                 f"🗺️ Map: {'Visible' if map_visible else 'Hidden'}"
             )
             title = f"⚔️ {info.server_name}"
-        except Exception:
-            status_line = "🔴 **Offline / unreachable**"
-            title = "⚠️ Valheim Server"
 
         embed = discord.Embed(title=title, description=status_line)
-        embed.add_field(name="🌍 Address", value=f"`{HOST}:{PORT}`", inline=False)
+        embed.add_field(
+            name="🌍 Address",
+            value=f"`{self.config.host}:{self.config.port}`",
+            inline=False,
+        )
         if self.message is not None:
             await self.message.edit(embed=embed)
 
@@ -93,10 +511,17 @@ class ValheimBot(discord.Client):
         await self.wait_until_ready()
 
 
-intents = discord.Intents.none()  # no privileged intents needed
-client = ValheimBot(intents=intents)
+def create_client(config: Optional[Config] = None) -> ValheimBot:
+    """Build a bot for ``config``, reading the environment if none is given."""
+    intents = discord.Intents.none()  # no privileged intents needed
+    return ValheimBot(config or Config.from_env(), intents=intents)
+
 
 if __name__ == "__main__":
+    # Before anything else logs (e.g. werkzeug in the health thread), so
+    # every record goes through the queue as JSON.
+    log_listener = setup_logging()
+
     # Start a tiny Flask health server for Docker/K8s
     health_host = os.getenv("HEALTH_HOST", "0.0.0.0")
     health_port = int(os.getenv("HEALTH_PORT", "8080"))
@@ -108,4 +533,10 @@ if __name__ == "__main__":
         _health_mod = importlib.import_module("health")
 
     _health_mod.start_health_server(host=health_host, port=health_port)
-    client.run(TOKEN)
+    client = create_client()
+    try:
+        # Logging is already routed through our queue; keep discord.py's
+        # default stream handler out of the way.
+        client.run(client.config.token, log_handler=None)
+    finally:
+        log_listener.stop()
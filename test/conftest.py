@@ -0,0 +1,33 @@
+import time
+from collections import defaultdict
+
+import pytest
+
+_started = 0.0
+_phase_totals: "defaultdict[str, float]" = defaultdict(float)
+_test_count = 0
+
+
+def pytest_sessionstart(session):
+    global _started
+    _started = time.perf_counter()
+
+
+def pytest_runtest_logreport(report):
+    global _test_count
+    _phase_totals[report.when] += report.duration
+    if report.when == "call":
+        _test_count += 1
+
+
+@pytest.hookimpl(trylast=True)
+def pytest_terminal_summary(terminalreporter):
+    """Report total suite runtime split by setup / call / teardown."""
+    total = time.perf_counter() - _started
+    terminalreporter.write_sep("-", "suite timing")
+    terminalreporter.write_line(
+        f"{_test_count} tests in {total:.2f}s "
+        f"(setup {_phase_totals['setup']:.2f}s, "
+        f"call {_phase_totals['call']:.2f}s, "
+        f"teardown {_phase_totals['teardown']:.2f}s)"
+    )
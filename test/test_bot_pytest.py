@@ -1,7 +1,13 @@
-import importlib
+import asyncio
+import io
+import json
+import logging
+import logging.handlers
 import os
+import queue
 import runpy
 import sys
+import time
 from unittest.mock import AsyncMock, Mock, call, patch
 
 import a2s
@@ -12,51 +18,56 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
 
 import bot  # noqa: E402
 
-
-@pytest.fixture(autouse=True)
-def mock_env():
-    """Mock environment variables for all tests."""
-    with patch.dict(
-        os.environ,
-        {
-            "DISCORD_TOKEN": "test_token",
-            "DISCORD_CHANNEL_ID": "123456789",
-            "DISCORD_MESSAGE_ID": "987654321",
-            "VALHEIM_HOST": "test.host.com",
-            "VALHEIM_QUERY_PORT": "2457",
-            "UPDATE_PERIOD": "1",  # Faster for testing
-        },
-    ):
-        importlib.reload(bot)
-        yield
+CONFIG = bot.Config(
+    token="test_token",
+    channel_id=123456789,
+    message_id=987654321,
+    host="test.host.com",
+    port=2457,
+    update_period=1,  # Faster for testing
+    offline_threshold=1,  # Report offline on the first failed probe
+)
 
 
 @pytest.fixture
 def bot_instance():
     """Create a bot instance for testing."""
-    intents = discord.Intents.none()
-    instance = bot.ValheimBot(intents=intents)
+    instance = bot.create_client(CONFIG)
     if hasattr(instance, "update_status"):
         instance.update_status.cancel()
     return instance
 
 
-def test_constants_are_loaded_from_env():
-    """Test that constants are correctly loaded from environment variables."""
-    assert bot.TOKEN == "test_token"
-    assert bot.CHANNEL_ID == 123456789
-    assert bot.MESSAGE_ID == 987654321
-    assert bot.HOST == "test.host.com"
-    assert bot.PORT == 2457
-    assert bot.UPDATE_PERIOD == 1
-    assert bot.ADDRESS == ("test.host.com", 2457)
+def test_config_from_env():
+    """Test that the config is correctly loaded from environment variables."""
+    env = {
+        "DISCORD_TOKEN": "test_token",
+        "DISCORD_CHANNEL_ID": "123456789  # inline comment",
+        "DISCORD_MESSAGE_ID": "987654321",
+        "VALHEIM_HOST": "test.host.com",
+        "VALHEIM_QUERY_PORT": "2457",
+        "UPDATE_PERIOD": "1",
+        "OFFLINE_THRESHOLD": "1",
+    }
+    assert bot.Config.from_env(env) == CONFIG
+    assert CONFIG.address == ("test.host.com", 2457)
+
+
+def test_config_defaults():
+    """Missing variables fall back to the documented defaults."""
+    with patch.dict(os.environ, {}, clear=True):
+        assert bot.Config.from_env() == bot.Config()
 
 
-@patch("discord.Client")
-def test_bot_instantiation(mock_client):
-    """Test that the ValheimBot is instantiated with the correct intents."""
-    assert isinstance(bot.client, bot.ValheimBot)
-    assert bot.client.intents.value == 0
+def test_bot_instantiation():
+    """Test that the ValheimBot is built from config with the correct intents."""
+    client = bot.create_client(CONFIG)
+    assert isinstance(client, bot.ValheimBot)
+    assert client.intents.value == 0
+    assert client.config is CONFIG
+    assert client.update_status.seconds == CONFIG.update_period
+    assert client.probe.address == CONFIG.address
+    assert client.probe.failure_threshold == CONFIG.offline_threshold
 
 
 @pytest.mark.asyncio
@@ -73,8 +84,8 @@ async def test_on_ready(bot_instance):
 
     await bot_instance.on_ready()
 
-    bot_instance.fetch_channel.assert_called_once_with(bot.CHANNEL_ID)
-    mock_channel.fetch_message.assert_called_once_with(bot.MESSAGE_ID)
+    bot_instance.fetch_channel.assert_called_once_with(CONFIG.channel_id)
+    mock_channel.fetch_message.assert_called_once_with(CONFIG.message_id)
     assert bot_instance.channel == mock_channel
     assert bot_instance.message == mock_message
     bot_instance.update_status.start.assert_called_once()
@@ -92,7 +103,9 @@ async def test_on_ready_invalid_channel(bot_instance, caplog):
     with caplog.at_level("ERROR"):
         await bot_instance.on_ready()
 
-    assert f"Channel {bot.CHANNEL_ID} is not a text channel or thread." in caplog.text
+    assert (
+        f"Channel {CONFIG.channel_id} is not a text channel or thread." in caplog.text
+    )
     assert bot_instance.message is None
     mock_channel.fetch_message.assert_not_called()
     bot_instance.update_status.start.assert_called_once()
@@ -134,8 +147,8 @@ async def test_update_status_online(mock_embed, mock_to_thread, bot_instance):
 
     mock_to_thread.assert_has_calls(
         [
-            call(a2s.info, bot.ADDRESS, timeout=3),
-            call(a2s.rules, bot.ADDRESS, timeout=3),
+            call(a2s.info, CONFIG.address, timeout=bot.QUERY_TIMEOUT),
+            call(a2s.rules, CONFIG.address, timeout=bot.QUERY_TIMEOUT),
         ]
     )
     mock_embed.assert_called_once_with(
@@ -143,7 +156,7 @@ async def test_update_status_online(mock_embed, mock_to_thread, bot_instance):
         description=expected_description,
     )
     mock_embed_instance.add_field.assert_called_once_with(
-        name="🌍 Address", value=f"`{bot.HOST}:{bot.PORT}`", inline=False
+        name="🌍 Address", value="`test.host.com:2457`", inline=False
     )
     bot_instance.message.edit.assert_called_once_with(embed=mock_embed_instance)
 
@@ -160,13 +173,23 @@ async def test_update_status_offline(mock_embed, mock_to_thread, bot_instance):
 
     await bot_instance.update_status()
 
-    mock_to_thread.assert_called_once_with(a2s.info, bot.ADDRESS, timeout=3)
+    # The retry only gets what is left of the probe's deadline.
+    mock_to_thread.assert_has_calls(
+        [
+            call(
+                a2s.info,
+                CONFIG.address,
+                timeout=pytest.approx(bot.QUERY_TIMEOUT, abs=0.1),
+            )
+        ]
+        * bot.PROBE_ATTEMPTS
+    )
     mock_embed.assert_called_once_with(
         title="⚠️ Valheim Server",
         description="🔴 **Offline / unreachable**",
     )
     mock_embed_instance.add_field.assert_called_once_with(
-        name="🌍 Address", value=f"`{bot.HOST}:{bot.PORT}`", inline=False
+        name="🌍 Address", value="`test.host.com:2457`", inline=False
     )
     bot_instance.message.edit.assert_called_once_with(embed=mock_embed_instance)
 
@@ -203,8 +226,8 @@ async def test_update_status_rules_fails(mock_embed, mock_to_thread, bot_instanc
 
     mock_to_thread.assert_has_calls(
         [
-            call(a2s.info, bot.ADDRESS, timeout=3),
-            call(a2s.rules, bot.ADDRESS, timeout=3),
+            call(a2s.info, CONFIG.address, timeout=bot.QUERY_TIMEOUT),
+            call(a2s.rules, CONFIG.address, timeout=bot.QUERY_TIMEOUT),
         ]
     )
     mock_embed.assert_called_once_with(
@@ -212,7 +235,7 @@ async def test_update_status_rules_fails(mock_embed, mock_to_thread, bot_instanc
         description=expected_description,
     )
     mock_embed_instance.add_field.assert_called_once_with(
-        name="🌍 Address", value=f"`{bot.HOST}:{bot.PORT}`", inline=False
+        name="🌍 Address", value="`test.host.com:2457`", inline=False
     )
     bot_instance.message.edit.assert_called_once_with(embed=mock_embed_instance)
 
@@ -278,15 +301,15 @@ async def test_update_status_player_counts(
 
     mock_to_thread.assert_has_calls(
         [
-            call(a2s.info, bot.ADDRESS, timeout=3),
-            call(a2s.rules, bot.ADDRESS, timeout=3),
+            call(a2s.info, CONFIG.address, timeout=bot.QUERY_TIMEOUT),
+            call(a2s.rules, CONFIG.address, timeout=bot.QUERY_TIMEOUT),
         ]
     )
     mock_embed.assert_called_once_with(
         title="⚔️ Test Server", description=expected_description
     )
     mock_embed_instance.add_field.assert_called_once_with(
-        name="🌍 Address", value=f"`{bot.HOST}:{bot.PORT}`", inline=False
+        name="🌍 Address", value="`test.host.com:2457`", inline=False
     )
     bot_instance.message.edit.assert_called_once_with(embed=mock_embed_instance)
 
@@ -314,30 +337,516 @@ async def test_update_status_exception_handling(
 
     await bot_instance.update_status()  # Should not raise
 
-    mock_to_thread.assert_called_once_with(a2s.info, bot.ADDRESS, timeout=3)
+    assert mock_to_thread.call_count == bot.PROBE_ATTEMPTS
     mock_embed.assert_called_once_with(
         title="⚠️ Valheim Server",
         description="🔴 **Offline / unreachable**",
     )
     mock_embed_instance.add_field.assert_called_once_with(
-        name="🌍 Address", value=f"`{bot.HOST}:{bot.PORT}`", inline=False
+        name="🌍 Address", value="`test.host.com:2457`", inline=False
     )
     bot_instance.message.edit.assert_called_once_with(embed=mock_embed_instance)
 
 
+@pytest.mark.asyncio
+@patch("asyncio.to_thread")
+@patch("discord.Embed")
+async def test_update_status_holds_state_below_threshold(
+    mock_embed, mock_to_thread, bot_instance
+):
+    """A few lost probes should not flip the embed to offline."""
+    mock_to_thread.side_effect = TimeoutError("timed out")
+    bot_instance.probe = bot.ServerProbe(CONFIG.address, failure_threshold=3)
+    bot_instance.message = AsyncMock()
+
+    await bot_instance.update_status()
+    await bot_instance.update_status()
+
+    bot_instance.message.edit.assert_not_called()
+    assert not bot_instance.probe.offline
+
+    await bot_instance.update_status()
+
+    assert bot_instance.probe.offline
+    mock_embed.assert_called_once_with(
+        title="⚠️ Valheim Server",
+        description="🔴 **Offline / unreachable**",
+    )
+    bot_instance.message.edit.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_probe_sends_hedge_for_slow_request():
+    """A hedge is sent once the first request outlives the adaptive timeout."""
+    probe = bot.ServerProbe(CONFIG.address)
+    probe.MIN_TIMEOUT = 0.01
+    probe.observe_rtt(0.001)
+    mock_info = Mock()
+    never = asyncio.Event()
+
+    async def fake_to_thread(*args, **kwargs):
+        if fake_to_thread.calls == 0:
+            fake_to_thread.calls += 1
+            await never.wait()
+        return mock_info
+
+    fake_to_thread.calls = 0
+
+    with patch("asyncio.to_thread", side_effect=fake_to_thread) as mock_to_thread:
+        assert await probe.probe() is mock_info
+
+    assert mock_to_thread.call_count == 2
+    assert probe.consecutive_failures == 0
+
+
+@pytest.mark.asyncio
+@patch("asyncio.to_thread")
+async def test_probe_retries_immediately_after_failure(mock_to_thread):
+    """A failed request is retried without waiting for the timeout."""
+    mock_info = Mock()
+    mock_to_thread.side_effect = [OSError("Network is unreachable"), mock_info]
+    probe = bot.ServerProbe(CONFIG.address)
+
+    assert await probe.probe() is mock_info
+    assert mock_to_thread.call_count == 2
+    assert probe.srtt is not None
+
+
+@pytest.mark.asyncio
+@patch("asyncio.to_thread")
+async def test_probe_offline_uses_single_short_request(mock_to_thread, caplog):
+    """While offline only one short request is sent until the server answers."""
+    mock_info = Mock()
+    mock_to_thread.side_effect = [TimeoutError("timed out"), mock_info]
+    probe = bot.ServerProbe(CONFIG.address, failure_threshold=1)
+    probe.offline = True
+    probe.consecutive_failures = probe.failure_threshold
+    probe.srtt, probe.rttvar = 0.1, 0.05
+
+    assert await probe.probe() is None
+    assert probe.offline
+    mock_to_thread.assert_called_once_with(
+        a2s.info, CONFIG.address, timeout=pytest.approx(0.3)
+    )
+
+    with caplog.at_level("INFO"):
+        assert await probe.probe() is mock_info
+
+    assert not probe.offline
+    assert probe.consecutive_failures == 0
+    assert "Reachable again" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_probe_shares_one_deadline():
+    """Hedges run on what is left of the deadline, bounding the whole probe."""
+    probe = bot.ServerProbe(CONFIG.address, max_timeout=0.05)
+    probe.MIN_TIMEOUT = 0.01
+    probe.observe_rtt(0.001)
+    never = asyncio.Event()
+
+    async def fake_to_thread(*args, **kwargs):
+        await never.wait()
+
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    with patch("asyncio.to_thread", side_effect=fake_to_thread) as mock_to_thread:
+        assert await probe.probe() is None
+
+    assert loop.time() - start < 0.5
+    first, hedge = (c.kwargs["timeout"] for c in mock_to_thread.call_args_list)
+    assert first == 0.05
+    assert hedge < 0.05
+    assert isinstance(probe.last_error, TimeoutError)
+
+
+@pytest.mark.asyncio
+async def test_probe_recovers_at_higher_rtt():
+    """Failed probes back off the timeout so a slower server can recover."""
+    probe = bot.ServerProbe(CONFIG.address, failure_threshold=1)
+    probe.offline = True
+    probe.consecutive_failures = probe.failure_threshold
+    probe.srtt, probe.rttvar = 0.02, 0.0
+    assert probe.timeout == bot.ServerProbe.MIN_TIMEOUT
+    mock_info = Mock()
+
+    async def fake_to_thread(func, address, timeout):
+        # The server now needs 0.4s to answer.
+        if timeout < 0.4:
+            raise TimeoutError("timed out")
+        return mock_info
+
+    with patch("asyncio.to_thread", side_effect=fake_to_thread):
+        assert await probe.probe() is None
+        assert probe.timeout == 0.5
+        assert await probe.probe() is mock_info
+
+    assert not probe.offline
+    assert probe.backoff == 1
+
+
+@pytest.mark.asyncio
+async def test_probe_offline_ticks_stay_cheap():
+    """Steady-state offline probes stay short, with a periodic full probe."""
+    probe = bot.ServerProbe(CONFIG.address, failure_threshold=1)
+    timeouts = []
+
+    async def fake_to_thread(func, address, timeout):
+        timeouts.append(timeout)
+        raise TimeoutError("timed out")
+
+    with patch("asyncio.to_thread", side_effect=fake_to_thread):
+        assert await probe.probe() is None
+        assert probe.offline
+        timeouts.clear()
+        for _ in range(3 * bot.ServerProbe.FULL_PROBE_EVERY):
+            assert await probe.probe() is None
+
+    full = timeouts[
+        bot.ServerProbe.FULL_PROBE_EVERY - 1 :: bot.ServerProbe.FULL_PROBE_EVERY
+    ]
+    assert full == [bot.QUERY_TIMEOUT] * 3
+    cheap = [
+        t for i, t in enumerate(timeouts) if (i + 1) % bot.ServerProbe.FULL_PROBE_EVERY
+    ]
+    assert cheap[-1] == bot.ServerProbe.RECOVERY_TIMEOUT
+    assert max(cheap) < bot.QUERY_TIMEOUT
+
+
+@pytest.mark.asyncio
+async def test_probe_full_probe_catches_slow_recovery():
+    """A server slower than RECOVERY_TIMEOUT recovers on the full probe."""
+    probe = bot.ServerProbe(CONFIG.address, failure_threshold=1)
+    probe.offline = True
+    probe.consecutive_failures = probe.failure_threshold
+    mock_info = Mock()
+
+    async def fake_to_thread(func, address, timeout):
+        # The server now needs 2s to answer.
+        if timeout < 2.0:
+            raise TimeoutError("timed out")
+        return mock_info
+
+    with patch("asyncio.to_thread", side_effect=fake_to_thread):
+        for _ in range(bot.ServerProbe.FULL_PROBE_EVERY - 1):
+            assert await probe.probe() is None
+        assert await probe.probe() is mock_info
+
+    assert not probe.offline
+
+
+def test_probe_backoff_caps_at_max_timeout():
+    """Backoff doubling stops once the timeout reaches max_timeout."""
+    probe = bot.ServerProbe(CONFIG.address, max_timeout=2.0)
+    probe.backoff = 2
+    assert probe.timeout == 2.0
+
+
+def test_probe_timeout_tracks_rtt():
+    """The adaptive timeout follows observed RTTs within its bounds."""
+    probe = bot.ServerProbe(CONFIG.address, max_timeout=2.0)
+    assert probe.timeout == bot.ServerProbe.INITIAL_TIMEOUT
+
+    probe.observe_rtt(0.1)
+    assert probe.srtt == pytest.approx(0.1)
+    assert probe.rttvar == pytest.approx(0.05)
+    assert probe.timeout == pytest.approx(0.3)
+
+    probe.observe_rtt(0.5)
+    assert probe.srtt == pytest.approx(0.15)
+    assert probe.rttvar == pytest.approx(0.1375)
+
+    probe.observe_rtt(10.0)
+    assert probe.timeout == 2.0
+
+    fast = bot.ServerProbe(CONFIG.address)
+    fast.observe_rtt(0.001)
+    assert fast.timeout == bot.ServerProbe.MIN_TIMEOUT
+
+
+@pytest.mark.asyncio
+@patch("asyncio.to_thread")
+async def test_probe_failure_logs_server(mock_to_thread, caplog):
+    """Failed probes are logged with the server and the last error."""
+    mock_to_thread.side_effect = TimeoutError("timed out")
+    probe = bot.ServerProbe(CONFIG.address, failure_threshold=1)
+
+    with caplog.at_level("WARNING"):
+        await probe.probe()
+
+    messages = [record.getMessage() for record in caplog.records]
+    assert messages == [
+        "A2S_INFO probe failed: TimeoutError('timed out')",
+        "Unreachable after 1 consecutive probes",
+    ]
+    assert {record.server for record in caplog.records} == {"test.host.com:2457"}
+
+
+def make_record(message, *args, level=logging.INFO, server=None, exc_info=None):
+    """Build a log record as the ``bot`` logger would."""
+    record = logging.LogRecord(
+        "bot", level, __file__, 1, message, args or None, exc_info
+    )
+    if server is not None:
+        record.server = server
+    return record
+
+
+def log_entries(stream):
+    return [json.loads(line) for line in stream.getvalue().splitlines()]
+
+
+@pytest.fixture
+def json_log(request):
+    """Route logging through setup_logging into a buffer, restoring root after."""
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+    stream = io.StringIO()
+    interval = getattr(request, "param", bot.LOG_REPEAT_INTERVAL)
+    listener = bot.setup_logging(logging.INFO, stream=stream, repeat_interval=interval)
+    yield stream, listener
+    listener.stop()
+    root.handlers, root.level = handlers, level
+
+
+def test_json_formatter():
+    """Records are rendered as one JSON object including structured extras."""
+    record = make_record(
+        "probe %s", "failed", level=logging.WARNING, server="test.host.com:2457"
+    )
+    record.repeats = 4
+
+    entry = json.loads(bot.JsonFormatter().format(record))
+
+    assert entry["level"] == "WARNING"
+    assert entry["logger"] == "bot"
+    assert entry["message"] == "probe failed"
+    assert entry["server"] == "test.host.com:2457"
+    assert entry["repeats"] == 4
+    assert entry["ts"].endswith("+00:00")
+    assert "exc" not in entry
+
+
+def test_json_formatter_exception():
+    """Exception details end up in their own field."""
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        record = make_record("oops", level=logging.ERROR, exc_info=sys.exc_info())
+
+    entry = json.loads(bot.JsonFormatter().format(record))
+
+    assert entry["message"] == "oops"
+    assert "ValueError: boom" in entry["exc"]
+    assert "server" not in entry
+
+
+@patch("time.monotonic")
+def test_repeat_filter_collapses_repeats(mock_monotonic):
+    """Identical records are dropped within the interval and counted."""
+    repeat_filter = bot.RepeatFilter(interval=60)
+
+    mock_monotonic.return_value = 0
+    assert repeat_filter.filter(make_record("down", server="a:1"))
+    assert repeat_filter.filter(make_record("down", server="b:2"))
+
+    mock_monotonic.return_value = 30
+    assert not repeat_filter.filter(make_record("down", server="a:1"))
+    assert not repeat_filter.filter(make_record("down", server="a:1"))
+    assert repeat_filter.filter(make_record("other", server="c:3"))
+
+    mock_monotonic.return_value = 61
+    sampled = make_record("down", server="a:1")
+    assert repeat_filter.filter(sampled)
+    assert sampled.repeats == 2
+
+    mock_monotonic.return_value = 200
+    fresh = make_record("down", server="a:1")
+    assert repeat_filter.filter(fresh)
+    assert not hasattr(fresh, "repeats")
+    assert repeat_filter.drain() == []
+
+
+@patch("time.monotonic")
+def test_repeat_filter_releases_on_new_message_for_server(mock_monotonic):
+    """A different message for the same server releases pending repeats."""
+    repeat_filter = bot.RepeatFilter(interval=60)
+    mock_monotonic.return_value = 0
+    repeat_filter.filter(make_record("down", server="a:1"))
+    repeat_filter.filter(make_record("down", server="b:2"))
+    for _ in range(2):
+        repeat_filter.filter(make_record("down", server="b:2"))
+    last_dropped = make_record("down", server="a:1")
+    for record in (make_record("down", server="a:1"), last_dropped):
+        assert not repeat_filter.filter(record)
+
+    assert repeat_filter.filter(make_record("Reachable again", server="a:1"))
+    assert repeat_filter.drain() == [last_dropped]
+    assert last_dropped.repeats == 1
+
+
+@patch("time.monotonic")
+def test_repeat_filter_bounds_keys(mock_monotonic):
+    """The least recently seen message is evicted once MAX_KEYS is reached."""
+    repeat_filter = bot.RepeatFilter(interval=60)
+    repeat_filter.MAX_KEYS = 2
+
+    mock_monotonic.return_value = 0
+    repeat_filter.filter(make_record("one"))
+    repeat_filter.filter(make_record("two"))
+    assert not repeat_filter.filter(make_record("one"))
+    last_dropped = make_record("one")
+    assert not repeat_filter.filter(last_dropped)
+
+    repeat_filter.filter(make_record("three"))
+    assert [key[3] for key in repeat_filter._seen] == ["one", "three"]
+    assert repeat_filter.drain() == []
+
+    repeat_filter.filter(make_record("four"))
+    assert [key[3] for key in repeat_filter._seen] == ["three", "four"]
+    assert repeat_filter.drain() == [last_dropped]
+    assert last_dropped.repeats == 1
+    assert repeat_filter.drain() == []
+
+
+@patch("time.monotonic")
+def test_repeat_filter_sweep_and_flush(mock_monotonic):
+    """Idle messages are released by sweep(), everything else by flush()."""
+    repeat_filter = bot.RepeatFilter(interval=60)
+
+    mock_monotonic.return_value = 10
+    repeat_filter.filter(make_record("down"))
+    repeat_filter.filter(make_record("quiet"))
+    last_dropped = make_record("down")
+    mock_monotonic.return_value = 20
+    assert not repeat_filter.filter(last_dropped)
+
+    mock_monotonic.return_value = 50
+    repeat_filter.sweep()
+    assert repeat_filter.drain() == []
+
+    mock_monotonic.return_value = 90
+    repeat_filter.sweep()
+    assert repeat_filter.drain() == [last_dropped]
+    assert not hasattr(last_dropped, "repeats")  # it is the only repeat
+    assert repeat_filter._seen == {}
+
+    repeat_filter.filter(make_record("up"))
+    pending = make_record("up")
+    assert not repeat_filter.filter(pending)
+    repeat_filter.flush()
+    assert repeat_filter.drain() == [pending]
+    assert repeat_filter.drain() == []
+
+
+def test_repeat_filter_passes_malformed_records():
+    """A bad format string is left for the handler to report, not raised."""
+    bad = make_record("a %s %s", 1)
+    assert bot.RepeatFilter().filter(bad)
+
+    log_queue = queue.SimpleQueue()
+    handler = bot.JsonQueueHandler(log_queue)
+    with patch.object(handler, "handleError") as mock_handle_error:
+        handler.handle(bad)
+
+    mock_handle_error.assert_called_once_with(bad)
+    assert log_queue.empty()
+
+
+def test_setup_logging_writes_json_in_background(json_log):
+    """Records go through the queue listener and come out as JSON lines."""
+    stream, listener = json_log
+    assert any(
+        isinstance(h, bot.JsonQueueHandler) for h in logging.getLogger().handlers
+    )
+    for _ in range(3):
+        logging.warning("down", extra={"server": "a:1"})
+
+    listener.stop()  # flushes the pending repeat count
+
+    entries = log_entries(stream)
+    assert [(e["message"], e["server"], e.get("repeats")) for e in entries] == [
+        ("down", "a:1", None),
+        ("down", "a:1", 1),
+    ]
+    assert not any(
+        isinstance(h, bot.JsonQueueHandler) for h in logging.getLogger().handlers
+    )
+
+
+@patch("time.monotonic")
+def test_setup_logging_accounts_for_every_repeat(mock_monotonic, json_log):
+    """Repeats pending when an outage ends are written before the recovery."""
+    stream, listener = json_log
+    for tick in range(10):
+        mock_monotonic.return_value = tick * 60
+        logging.warning("down", extra={"server": "a:1"})
+    mock_monotonic.return_value = 600
+    logging.info("Reachable again", extra={"server": "a:1"})
+    listener.stop()
+
+    entries = [(e["message"], e.get("repeats")) for e in log_entries(stream)]
+    assert entries == [
+        ("down", None),
+        ("down", 4),  # sampled after 4 repeats
+        ("down", 3),  # last of 4 repeats, released by the recovery
+        ("Reachable again", None),
+    ]
+
+
+@pytest.mark.parametrize("json_log", [0.05], indirect=True)
+def test_setup_logging_sweeps_idle_repeats(json_log):
+    """Pending repeats are written on a timer, without further logging."""
+    stream, listener = json_log
+    for _ in range(3):
+        logging.warning("down", extra={"server": "a:1"})
+
+    deadline = time.monotonic() + 5
+    while len(stream.getvalue().splitlines()) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    entries = log_entries(stream)
+    assert [(e["message"], e.get("repeats")) for e in entries] == [
+        ("down", None),
+        ("down", 1),
+    ]
+
+
+def test_setup_logging_keeps_exception_separate(json_log):
+    """Tracebacks survive the queue in their own field."""
+    stream, listener = json_log
+    try:
+        raise ValueError("boom")
+    except ValueError:
+        logging.exception("probe crashed: %s", "a:1")
+    listener.stop()
+
+    (entry,) = log_entries(stream)
+    assert entry["message"] == "probe crashed: a:1"
+    assert "ValueError: boom" in entry["exc"]
+    assert "Traceback" not in entry["message"]
+
+
 @patch("discord.Client.run")
 def test_main_execution(mock_run):
     """
     Running the module as a script should call client.run once with the token.
     """
 
+    root = logging.getLogger()
+    handlers, level = root.handlers[:], root.level
+
     # Ensure environment has a token so the code path executes.
     with patch.dict(os.environ, {"DISCORD_TOKEN": "test_token"}):
         # Execute the module as __main__ (fresh namespace) – this simulates
         # `python -m bot` and triggers the bottom-of-file client.run call.
-        runpy.run_module("bot", run_name="__main__")
+        try:
+            globs = runpy.run_module("bot", run_name="__main__")
+        finally:
+            root.handlers, root.level = handlers, level
 
-    mock_run.assert_called_once_with("test_token")
+    mock_run.assert_called_once_with("test_token", log_handler=None)
+    assert globs["log_listener"]._thread is None  # stopped on shutdown
 
 
 if __name__ == "__main__":
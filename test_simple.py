@@ -10,25 +10,18 @@ import sys
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "src"))
 
 try:
-    from bot import (
-        ADDRESS,
-        HOST,
-        PORT,
-        UPDATE_PERIOD,
-        ValheimBot,
-    )
+    from bot import Config, ValheimBot, create_client
 
     print("✅ Import successful!")
-    print(f"ADDRESS: {ADDRESS}")
-    print(f"HOST: {HOST}")
-    print(f"PORT: {PORT}")
-    print(f"UPDATE_PERIOD: {UPDATE_PERIOD}")
+    config = Config.from_env()
+    print(f"ADDRESS: {config.address}")
+    print(f"HOST: {config.host}")
+    print(f"PORT: {config.port}")
+    print(f"UPDATE_PERIOD: {config.update_period}")
 
     # Test bot creation
-    import discord
-
-    intents = discord.Intents.none()
-    bot = ValheimBot(intents=intents)
+    bot = create_client(config)
+    assert isinstance(bot, ValheimBot)
     print("✅ Bot creation successful!")
 
 except Exception as e: